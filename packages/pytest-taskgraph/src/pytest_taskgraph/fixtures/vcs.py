@@ -1,63 +1,97 @@
+import errno
+import functools
 import os
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
-from taskgraph.util.vcs import get_repository
+from taskgraph.util.vcs import GitRepository, HgRepository
 
 _FORCE_COMMIT_DATE_TIME = "2019-11-04T10:03:58+00:00"
 
 
-@pytest.fixture(scope="package")
-def hg_repo(tmpdir_factory):
-    tmpdir = tmpdir_factory.mktemp("hgrepo")
-    repo_dir = _init_repo(tmpdir, "hg")
-    with open(os.path.join(repo_dir, ".hg", "hgrc"), "a") as f:
+@pytest.fixture(scope="session")
+def repo_templates(tmp_path_factory):
+    """Create the hg and git template repositories concurrently.
+
+    Creating them is dominated by waiting on VCS subprocesses, so doing so in
+    parallel roughly halves the setup time.
+    """
+    hg_tmp_path = tmp_path_factory.mktemp("hgrepo")
+    git_tmp_path = tmp_path_factory.mktemp("gitrepo")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hg_future = executor.submit(_create_hg_repo, hg_tmp_path)
+        git_future = executor.submit(_create_git_repo, git_tmp_path)
+        return {"hg": hg_future.result(), "git": git_future.result()}
+
+
+@pytest.fixture(scope="session")
+def hg_repo(repo_templates):
+    return repo_templates["hg"]
+
+
+@pytest.fixture(scope="session")
+def git_repo(repo_templates):
+    return repo_templates["git"]
+
+
+def _create_hg_repo(tmp_path):
+    repo_dir = _init_repo(tmp_path, "hg")
+    with open(repo_dir / ".hg" / "hgrc", "a") as f:
         f.write(
             """[ui]
 username = Integration Tests <integration@tests.test>
 """
         )
 
+    # Let `commit` add the initial file rather than spawning a separate `hg add`,
+    # as each hg invocation pays for Mercurial's startup time.
     # hg sometimes errors out with "nothing changed" even though the commit succeeded
-    subprocess.call(
-        ["hg", "commit", "-m", "First commit", "--date", _FORCE_COMMIT_DATE_TIME],
+    _silent_run(
+        [
+            "hg",
+            "commit",
+            "--addremove",
+            "-m",
+            "First commit",
+            "--date",
+            _FORCE_COMMIT_DATE_TIME,
+        ],
+        check=False,
         cwd=repo_dir,
     )
-    yield repo_dir
+    return str(repo_dir)
 
 
 _GIT_DATE_ENV_VARS = ("GIT_AUTHOR_DATE", "GIT_COMMITTER_DATE")
 
 
-@pytest.fixture(scope="package")
-def git_repo(tmpdir_factory):
-    env = _build_env_with_git_date_env_vars(_FORCE_COMMIT_DATE_TIME)
-    tmpdir = tmpdir_factory.mktemp("gitrepo")
-    repo_dir = _init_repo(tmpdir, "git")
+def _create_git_repo(tmp_path):
+    env = _git_env()
+    repo_dir = _init_repo(tmp_path, "git")
 
-    subprocess.check_output(
-        ["git", "config", "user.email", "integration@tests.test"], cwd=repo_dir, env=env
-    )
-    subprocess.check_output(
-        ["git", "config", "user.name", "Integration Tests"], cwd=repo_dir, env=env
-    )
-
-    # This is mostly for local dev
-    # If gpg signing is on it will fail calculating the head ref
-    subprocess.check_output(
-        ["git", "config", "commit.gpgsign", "false"], cwd=repo_dir, env=env
-    )
-
-    subprocess.check_output(
-        ["git", "commit", "-m", "First commit"], cwd=repo_dir, env=env
-    )
+    # Writing the config directly is much cheaper than running `git config`
+    # once per setting.
+    # Disabling gpg signing is mostly for local dev. If gpg signing is on it
+    # will fail calculating the head ref.
+    with open(repo_dir / ".git" / "config", "a") as f:
+        f.write(
+            """[user]
+email = integration@tests.test
+name = Integration Tests
+[commit]
+gpgsign = false
+"""
+        )
 
-    yield repo_dir
+    _silent_run(["git", "add", "first_file"], cwd=repo_dir, env=env)
+    _silent_run(["git", "commit", "-m", "First commit"], cwd=repo_dir, env=env)
+    return str(repo_dir)
 
 
-@pytest.fixture(scope="package")
+@pytest.fixture(scope="session")
 def default_git_branch():
     proc = subprocess.run(
         ["git", "config", "init.defaultBranch"],
@@ -68,69 +102,117 @@ def default_git_branch():
     return proc.stdout.strip() or "master"
 
 
-def _build_env_with_git_date_env_vars(date_time_string):
-    env = os.environ.copy()
-    env.update({env_var: date_time_string for env_var in _GIT_DATE_ENV_VARS})
-    return env
+@functools.lru_cache(maxsize=None)
+def _git_env():
+    """Return the environment for git commands, with the commit date forced.
+
+    This is built lazily rather than at import time, as conftest files may
+    still modify `os.environ` after the plugin is imported. Callers must not
+    mutate the returned dict.
+    """
+    return {
+        **os.environ,
+        **{env_var: _FORCE_COMMIT_DATE_TIME for env_var in _GIT_DATE_ENV_VARS},
+    }
 
 
-def _init_repo(tmpdir, repo_type):
-    repo_dir = os.path.join(tmpdir.strpath, repo_type)
-    os.mkdir(repo_dir)
-    first_file_path = tmpdir.join(repo_type, "first_file")
-    first_file_path.write("first piece of data")
+def _silent_run(cmd, check=True, **kwargs):
+    """Run a setup command whose output isn't needed.
+
+    Stderr is left alone so failures remain debuggable.
+    """
+    return subprocess.run(cmd, check=check, stdout=subprocess.DEVNULL, **kwargs)
 
-    subprocess.check_output([repo_type, "init"], cwd=repo_dir)
-    subprocess.check_output([repo_type, "add", first_file_path.strpath], cwd=repo_dir)
+
+def _init_repo(tmp_path, repo_type):
+    repo_dir = tmp_path / repo_type
+    repo_dir.mkdir()
+    (repo_dir / "first_file").write_text("first piece of data")
+
+    _silent_run([repo_type, "init"], cwd=repo_dir)
 
     return repo_dir
 
 
+# Directories holding the VCS object stores. Files in them are never modified
+# in place (git writes new objects atomically and Mercurial breaks hard links
+# before writing), so they can be shared between copies of a repository.
+_STORE_DIRS = (os.path.join(".git", "objects"), os.path.join(".hg", "store"))
+
+
+def _copy_repo(src, dst):
+    """Copy the repository at `src` to `dst`, hard linking its object store."""
+
+    def copy_function(src_file, dst_file):
+        if os.path.relpath(src_file, src).startswith(_STORE_DIRS):
+            try:
+                os.link(src_file, dst_file)
+                return
+            except OSError as e:
+                # Hard links can't span file systems.
+                if e.errno != errno.EXDEV:
+                    raise
+        shutil.copy2(src_file, dst_file)
+
+    shutil.copytree(src, dst, copy_function=copy_function)
+
+
 @pytest.fixture(params=("git", "hg"))
-def repo(request, hg_repo, git_repo, monkeypatch, tmpdir):
+def repo(request, hg_repo, git_repo, monkeypatch, tmp_path):
     """
     The repo fixture depends on the session-scoped git and hg repo fixtures, and
         copies the contents of the initialized repos to a temp folder
     """
-    repodir = tmpdir.join(request.param)
+    # The repository type is known, so instantiate it directly rather than
+    # having `get_repository` probe the directory.
+    repodir = tmp_path / request.param
     if request.param == "hg":
         monkeypatch.setenv("HGPLAIN", "1")
-        shutil.copytree(hg_repo, repodir)
-        return get_repository(repodir)
-    shutil.copytree(git_repo, repodir)
-    return get_repository(repodir)
+        _copy_repo(hg_repo, repodir)
+        return HgRepository(str(repodir))
+    _copy_repo(git_repo, repodir)
+    return GitRepository(str(repodir))
+
+
+def _create_remote_tracking_ref(repo, remote_branch):
+    """Point the remote tracking ref for `remote_branch` at HEAD.
+
+    The remote is a copy of `repo`, so this is what `git fetch` would
+    do, without the extra process and ref negotiation.
+    """
+    repo.run("update-ref", f"refs/remotes/{remote_branch}", "HEAD")
 
 
 @pytest.fixture
 def create_remote_repo(default_git_branch):
-    def inner(tmpdir, repo, remote_name, remote_path):
+    def inner(tmp_path, repo, remote_name, remote_path):
         if repo.tool == "hg":
             repo.run("phase", "--public", ".")
 
-        shutil.copytree(repo.path, str(tmpdir / remote_path))
+        remote_dir = tmp_path / remote_path
+        _copy_repo(repo.path, remote_dir)
 
         if repo.tool == "git":
-            repo.run("remote", "add", remote_name, f"{tmpdir}/{remote_path}")
-            repo.run("fetch", remote_name)
-            repo.run(
-                "branch", "--set-upstream-to", f"{remote_name}/{default_git_branch}"
-            )
+            remote_branch = f"{remote_name}/{default_git_branch}"
+            repo.run("remote", "add", remote_name, str(remote_dir))
+            _create_remote_tracking_ref(repo, remote_branch)
+            repo.run("branch", "--set-upstream-to", remote_branch)
         if repo.tool == "hg":
-            with open(os.path.join(repo.path, ".hg/hgrc"), "a") as f:
-                f.write(f"[paths]\n{remote_name} = {tmpdir}/{remote_path}\n")
+            with open(os.path.join(repo.path, ".hg", "hgrc"), "a") as f:
+                f.write(f"[paths]\n{remote_name} = {remote_dir}\n")
 
     return inner
 
 
 @pytest.fixture
-def repo_with_remote(tmpdir, create_remote_repo, repo):
+def repo_with_remote(tmp_path, create_remote_repo, repo):
     remote_name = "upstream"
-    create_remote_repo(tmpdir, repo, remote_name, "remote_repo")
+    create_remote_repo(tmp_path, repo, remote_name, "remote_repo")
     return repo, remote_name
 
 
 @pytest.fixture
-def repo_with_upstream(tmpdir, repo, default_git_branch):
+def repo_with_upstream(tmp_path, repo, default_git_branch):
     with open(os.path.join(repo.path, "second_file"), "w") as f:
         f.write("some data for the second file")
 
@@ -140,17 +222,18 @@ def repo_with_upstream(tmpdir, repo, default_git_branch):
     if repo.tool == "hg":
         repo.run("phase", "--public", ".")
 
-    shutil.copytree(repo.path, str(tmpdir / "remoterepo"))
+    remote_dir = tmp_path / "remoterepo"
+    _copy_repo(repo.path, remote_dir)
     upstream_location = None
 
     if repo.tool == "git":
         upstream_location = f"upstream/{default_git_branch}"
-        repo.run("remote", "add", "upstream", f"{tmpdir}/remoterepo")
-        repo.run("fetch", "upstream")
+        repo.run("remote", "add", "upstream", str(remote_dir))
+        _create_remote_tracking_ref(repo, upstream_location)
         repo.run("branch", "--set-upstream-to", upstream_location)
     if repo.tool == "hg":
-        upstream_location = f"{tmpdir}/remoterepo"
-        with open(os.path.join(repo.path, ".hg/hgrc"), "w") as f:
+        upstream_location = str(remote_dir)
+        with open(os.path.join(repo.path, ".hg", "hgrc"), "w") as f:
             f.write(f"[paths]\ndefault = {upstream_location}")
 
     return repo, upstream_location
@@ -101,13 +101,18 @@ def json_time_from_now(input_str, now=None, datetime_format=False):
         return time.isoformat(timespec="milliseconds") + "Z"
 
 
-def current_json_time(datetime_format=False):
+def current_json_time(datetime_format=False, now=None):
     """
     :param boolean datetime_format: Set `True` to get a `datetime` output
+    :param datetime now: Optionally set the definition of `now`
     :returns: JSON string representation of the current time.
     """
+    time = now
+    if time is None:
+        time = datetime.datetime.utcnow()
+
     if datetime_format is True:
-        return datetime.datetime.utcnow()
+        return time
     else:
         # Microseconds are excluded (see bug 1381801)
-        return datetime.datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+        return time.isoformat(timespec="milliseconds") + "Z"
@@ -3,11 +3,13 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
+import functools
 import logging
 import os
 import re
 import subprocess
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from shutil import which
 
 from taskgraph.util.path import ancestors
@@ -17,6 +19,22 @@ PUSHLOG_TMPL = "{}/json-pushes?version=2&changeset={}&tipsonly=1&full=1"
 logger = logging.getLogger(__name__)
 
 
+def _memoize_on_config(func):
+    """Like `functools.cached_property`, but the value is also recomputed when
+    the repository's config file changes, as it may be edited directly."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        stat = self._config_stat()
+        cached = self._config_memos.get(name)
+        if cached is None or cached[0] != stat:
+            cached = self._config_memos[name] = (stat, func(self))
+        return cached[1]
+
+    return property(wrapper)
+
+
 class Repository(ABC):
     # Both mercurial and git use sha1 as revision identifiers. Luckily, both define
     # the same value as the null revision.
@@ -24,6 +42,34 @@ class Repository(ABC):
     # https://github.com/git/git/blob/dc04167d378fb29d30e1647ff6ff51dd182bc9a3/t/oid-info/hash-info#L7
     # https://www.mercurial-scm.org/repo/hg-stable/file/82efc31bd152/mercurial/node.py#l30
     NULL_REVISION = "0000000000000000000000000000000000000000"
+    _NODE_PATTERN = re.compile(r"[0-9a-f]{40}$")
+
+    # Subcommands that only query the repository. Running any other command
+    # forgets memoized state, as it may have modified the repository.
+    _READ_ONLY_COMMANDS = {
+        "cat-file",
+        "diff",
+        "log",
+        "ls-remote",
+        "merge-base",
+        "outgoing",
+        "path",
+        "paths",
+        "rev-list",
+        "rev-parse",
+        "status",
+    }
+    # Read-only invocations of subcommands that can also modify the repository.
+    _READ_ONLY_INVOCATIONS = {
+        ("branch", "--all"),
+        ("branch", "--show-current"),
+        ("remote",),
+        ("remote", "get-url"),
+    }
+    # Properties memoized with `functools.cached_property`.
+    _CACHED_PROPERTIES = ("head_rev", "branch")
+    # Number of `(rev, base_rev)` pairs whose changed files are memoized.
+    _CHANGED_FILES_CACHE_SIZE = 128
 
     def __init__(self, path):
         self.path = path
@@ -33,11 +79,20 @@ class Repository(ABC):
         self._valid_diff_filter = ("m", "a", "d")
 
         self._env = os.environ.copy()
+        # Changes per `(rev, base_rev)`, as returned by `_get_file_changes`,
+        # least recently used first. Only full node ids are used as keys, so
+        # entries never go stale.
+        self._changed_files = OrderedDict()
+        # Values memoized with `_memoize_on_config`, with the config's stat.
+        self._config_memos = {}
 
     def run(self, *args: str, **kwargs):
         return_codes = kwargs.pop("return_codes", [])
         cmd = (self.binary,) + args
 
+        if not self._is_read_only(args):
+            self.invalidate_caches()
+
         try:
             return subprocess.check_output(  # type: ignore
                 cmd,  # type: ignore
@@ -51,15 +106,79 @@ class Repository(ABC):
                 return ""
             raise
 
+    def _run_bytes(self, *args: str) -> bytes:
+        """Run a read-only command and return its undecoded output."""
+        return subprocess.check_output(
+            (self.binary,) + args,  # type: ignore
+            cwd=self.path,
+            env=self._env,
+        )
+
+    def _is_read_only(self, args):
+        return bool(args) and (
+            args[0] in self._READ_ONLY_COMMANDS
+            or args[:2] in self._READ_ONLY_INVOCATIONS
+        )
+
+    def invalidate_caches(self):
+        """Forget memoized properties, as the repository state may have changed.
+
+        This is called automatically when a command that isn't known to be
+        read-only is passed to :meth:`run`. Call it explicitly after modifying
+        the repository by other means, e.g. by running ``git`` or ``hg``
+        directly.
+        """
+        for name in self._CACHED_PROPERTIES:
+            vars(self).pop(name, None)
+        self._config_memos.clear()
+
+    def _memoized_file_changes(self, rev, base_rev, get_changes):
+        """Return `get_changes()`, memoized if `rev` and `base_rev` are node ids.
+
+        The working directory (`rev` is None) may change without going through
+        `run`, so its status is never cached. Neither are symbolic revisions,
+        such as `HEAD` or branch names, as they may move.
+        """
+        if rev is None or not all(
+            self._NODE_PATTERN.match(r) for r in (rev, base_rev) if r is not None
+        ):
+            return get_changes()
+        key = (rev, base_rev)
+        try:
+            self._changed_files.move_to_end(key)
+        except KeyError:
+            self._changed_files[key] = get_changes()
+            if len(self._changed_files) > self._CHANGED_FILES_CACHE_SIZE:
+                self._changed_files.popitem(last=False)
+        return self._changed_files[key]
+
+    def _config_stat(self):
+        if self._config_path is None:
+            return None
+        try:
+            st = os.stat(self._config_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
     @property
     @abstractmethod
     def tool(self) -> str:
         """Version control system being used, either 'hg' or 'git'."""
 
+    @property
+    def _config_path(self):
+        """Path to the repository's config file, if known."""
+        return None
+
     @property
     @abstractmethod
     def head_rev(self) -> str:
-        """Hash of HEAD revision."""
+        """Hash of HEAD revision.
+
+        The value is memoized. Call :meth:`invalidate_caches` after moving
+        HEAD without going through :meth:`run`.
+        """
 
     @property
     @abstractmethod
@@ -69,7 +188,11 @@ class Repository(ABC):
     @property
     @abstractmethod
     def branch(self):
-        """Current branch or bookmark the checkout has active."""
+        """Current branch or bookmark the checkout has active.
+
+        The value may be memoized. Call :meth:`invalidate_caches` after
+        switching branches without going through :meth:`run`.
+        """
 
     @property
     @abstractmethod
@@ -189,6 +312,8 @@ class Repository(ABC):
     def does_revision_exist_locally(self, revision):
         """Check whether this revision exists in the local repository.
 
+        Blank revisions are rejected without invoking the VCS.
+
         If this function returns an unexpected value, then make sure
         the revision was fetched from the remote repository."""
 
@@ -207,6 +332,10 @@ class HgRepository(Repository):
         self._env["HGPLAIN"] = "1"
 
     @property
+    def _config_path(self):
+        return os.path.join(self.path, ".hg", "hgrc")
+
+    @functools.cached_property
     def head_rev(self):
         return self.run("log", "-r", ".", "-T", "{node}").strip()
 
@@ -224,14 +353,14 @@ class HgRepository(Repository):
 
         return None
 
-    @property
+    @_memoize_on_config
     def all_remote_names(self):
         remotes = self.run("paths", "--quiet").splitlines()
         if not remotes:
             raise RuntimeError("No remotes defined")
         return remotes
 
-    @property
+    @_memoize_on_config
     def remote_name(self):
         return self._get_most_suitable_remote(
             "Edit .hg/hgrc and add:\n\n[paths]\ndefault = $URL",
@@ -250,14 +379,10 @@ class HgRepository(Repository):
         revision = revision or "."
         return self.run("log", "-r", revision, "-T", "{desc}")
 
-    def _format_diff_filter(self, diff_filter, for_status=False):
+    def _format_diff_filter(self, diff_filter):
         df = diff_filter.lower()
         assert all(f in self._valid_diff_filter for f in df)
-
-        # When looking at the changes in the working directory, the hg status
-        # command uses 'd' for files that have been deleted with a non-hg
-        # command, and 'r' for files that have been `hg rm`ed. Use both.
-        return df.replace("d", "dr") if for_status else df
+        return df
 
     def _files_template(self, diff_filter):
         template = ""
@@ -270,19 +395,40 @@ class HgRepository(Repository):
             template += "{file_mods % '{file}\\n'}"
         return template
 
-    def get_changed_files(
-        self, diff_filter="ADM", mode="unstaged", rev=None, base_rev=None
-    ):
+    def _get_file_changes(self, rev=None, base_rev=None):
+        """Return ``(status, path)`` pairs, using git's A/D/M letters."""
         if rev is None:
-            if base_rev is not None:
-                raise ValueError("Cannot specify `base_rev` without `rev`")
-            # Use --no-status to print just the filename.
-            df = self._format_diff_filter(diff_filter, for_status=True)
-            return self.run("status", "--no-status", f"-{df}").splitlines()
+            # The hg status command uses '!' for files that have been deleted
+            # with a non-hg command, and 'R' for files that have been `hg rm`ed.
+            output = self._run_bytes("status", "-amdr", "-0")
+            statuses = {"A": "A", "M": "M", "R": "D", "!": "D"}
         else:
-            template = self._files_template(diff_filter)
+            template = (
+                "{file_adds % 'A {file}\\0'}"
+                "{file_dels % 'D {file}\\0'}"
+                "{file_mods % 'M {file}\\0'}"
+            )
             revision_argument = rev if base_rev is None else f"{base_rev}~-1::{rev}"
-            return self.run("log", "-r", revision_argument, "-T", template).splitlines()
+            output = self._run_bytes("log", "-r", revision_argument, "-T", template)
+            statuses = {"A": "A", "M": "M", "D": "D"}
+
+        # Entries are "<status> <path>", separated by NUL bytes.
+        return [
+            (statuses[chr(entry[0])], entry[2:].decode("utf-8"))
+            for entry in output.split(b"\0")
+            if entry
+        ]
+
+    def get_changed_files(
+        self, diff_filter="ADM", mode="unstaged", rev=None, base_rev=None
+    ):
+        df = self._format_diff_filter(diff_filter).upper()
+        if rev is None and base_rev is not None:
+            raise ValueError("Cannot specify `base_rev` without `rev`")
+        changes = self._memoized_file_changes(
+            rev, base_rev, lambda: self._get_file_changes(rev, base_rev)
+        )
+        return [path for status, path in changes if status in df]
 
     def get_outgoing_files(self, diff_filter="ADM", upstream=None):
         template = self._files_template(diff_filter)
@@ -328,6 +474,9 @@ class HgRepository(Repository):
         return ancestor or self.NULL_REVISION
 
     def does_revision_exist_locally(self, revision):
+        if not revision.strip():
+            return False
+
         try:
             return bool(self.run("log", "-r", revision).strip())
         except subprocess.CalledProcessError as e:
@@ -349,7 +498,13 @@ class GitRepository(Repository):
 
     _LS_REMOTE_PATTERN = re.compile(r"ref:\s+refs/heads/(?P<branch_name>\S+)\s+HEAD")
 
-    @property
+    @functools.cached_property
+    def _config_path(self):
+        # The config is shared by all worktrees of the repository.
+        git_dir = self.run("rev-parse", "--git-common-dir").strip()
+        return os.path.join(self.path, git_dir, "config")
+
+    @functools.cached_property
     def head_rev(self):
         return self.run("rev-parse", "--verify", "HEAD").strip()
 
@@ -362,18 +517,18 @@ class GitRepository(Repository):
             return refs[-1][1:]  # boundary starts with a prefix `-`
         return self.head_rev
 
-    @property
+    @functools.cached_property
     def branch(self):
         return self.run("branch", "--show-current").strip() or None
 
-    @property
+    @_memoize_on_config
     def all_remote_names(self):
         remotes = self.run("remote").splitlines()
         if not remotes:
             raise RuntimeError("No remotes defined")
         return remotes
 
-    @property
+    @_memoize_on_config
     def remote_name(self):
         try:
             remote_branch_name = self.run(
@@ -405,7 +560,7 @@ class GitRepository(Repository):
 
         try:
             # This call works if you have (network) access to the repo
-            return self._get_default_branch_from_remote_query()
+            return self._remote_default_branch
         except (subprocess.CalledProcessError, RuntimeError):
             pass
 
@@ -413,6 +568,12 @@ class GitRepository(Repository):
         # the local repo is where `git init` was made
         return self._guess_default_branch()
 
+    @_memoize_on_config
+    def _remote_default_branch(self):
+        # Querying the remote needs network access, so it is only done again
+        # once the remotes are reconfigured.
+        return self._get_default_branch_from_remote_query()
+
     def _get_default_branch_from_remote_query(self):
         # This function requires network access to the repo
         remote_name = self.remote_name
@@ -452,10 +613,20 @@ class GitRepository(Repository):
         revision = revision or "HEAD"
         return self.run("log", "-n1", "--format=%B", revision)
 
+    def _get_file_changes(self, cmd):
+        """Return ``(status, path)`` pairs listed by a ``--name-status`` command."""
+        # Consider renames as deletion of old, addition of new.
+        output = self._run_bytes(*cmd, "--name-status", "--no-renames", "-z")
+        # Statuses and paths alternate, separated by NUL bytes. `git log`
+        # also emits an empty entry between revisions.
+        entries = [entry.decode("utf-8") for entry in output.split(b"\0") if entry]
+        return list(zip(entries[::2], entries[1::2]))
+
     def get_changed_files(
         self, diff_filter="ADM", mode="unstaged", rev=None, base_rev=None
     ):
         assert all(f.lower() in self._valid_diff_filter for f in diff_filter)
+        diff_filter = diff_filter.upper()
 
         if rev is None:
             if base_rev is not None:
@@ -470,15 +641,11 @@ class GitRepository(Repository):
                 f"{rev}~1..{rev}" if base_rev is None else f"{base_rev}..{rev}"
             )
             cmd = ["log", "--format=format:", revision_argument]
+        changes = self._memoized_file_changes(
+            rev, base_rev, lambda: self._get_file_changes(cmd)
+        )
 
-        cmd.append("--name-only")
-        cmd.append(
-            "--no-renames"
-        )  # Consider renames as deletion of old, addition of new.
-        cmd.append("--diff-filter=" + diff_filter.upper())
-
-        files = self.run(*cmd).splitlines()
-        return [f for f in files if f]
+        return [path for status, path in changes if status in diff_filter]
 
     def get_outgoing_files(self, diff_filter="ADM", upstream=None):
         assert all(f.lower() in self._valid_diff_filter for f in diff_filter)
@@ -525,6 +692,9 @@ class GitRepository(Repository):
             return self.NULL_REVISION
 
     def does_revision_exist_locally(self, revision):
+        if not revision.strip():
+            return False
+
         try:
             return self.run("cat-file", "-t", revision).strip() == "commit"
         except subprocess.CalledProcessError as e:
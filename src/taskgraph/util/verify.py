@@ -93,6 +93,7 @@ class VerificationSequence:
     """
 
     _verifications: Dict = field(default_factory=dict)
+    _by_name: Dict = field(default_factory=dict)
     _verification_types = {
         "graph": GraphVerification,
         "initial": InitialVerification,
@@ -108,11 +109,18 @@ class VerificationSequence:
         cls = self._verification_types.get(name, GraphVerification)
 
         def wrap(func):
-            self._verifications.setdefault(name, []).append(cls(func, **kwargs))
+            verification = cls(func, **kwargs)
+            self._verifications.setdefault(name, []).append(verification)
+            self._by_name[func.__name__] = verification
             return func
 
         return wrap
 
+    def get(self, name) -> Union[Verification, None]:
+        """Return the verification wrapping the function called ``name``,
+        or None if there is no such verification."""
+        return self._by_name.get(name)
+
 
 verifications = VerificationSequence()
 
@@ -14,6 +14,36 @@ from responses import matchers
 from taskgraph.task import Task
 from taskgraph.util import taskcluster as tc
 
+LIST_ARTIFACTS_REPLY = {"artifacts": ["file1.txt", "file2.json"]}
+
+LIST_TASKS_REPLIES = (
+    {
+        "continuationToken": "x",
+        "tasks": [{"taskId": "123", "expires": "2023-02-10T19:07:33.700Z"}],
+    },
+    {
+        "tasks": [{"taskId": "abc", "expires": "2023-02-09T19:07:33.700Z"}],
+    },
+)
+
+LIST_TASK_GROUP_REPLIES = (
+    {
+        "continuationToken": "x",
+        "tasks": [
+            {"status": {"taskId": "1", "state": "pending"}},
+            {"status": {"taskId": "2", "state": "unscheduled"}},
+        ],
+    },
+    {
+        "tasks": [
+            {"status": {"taskId": "3", "state": "running"}},
+            {"status": {"taskId": "4", "state": "completed"}},
+        ],
+    },
+)
+
+TASK_DEFINITION = {"payload": "blah"}
+
 
 @pytest.fixture(autouse=True)
 def mock_environ(monkeypatch):
@@ -26,9 +56,22 @@ def mock_production_taskcluster_root_url(monkeypatch):
     monkeypatch.setattr(tc, "PRODUCTION_TASKCLUSTER_ROOT_URL", "https://tc.example.com")
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Ensure memoized results don't leak between tests, or into other test
+    # modules once the mocked environment is gone.
+    def clear():
+        for obj in vars(tc).values():
+            if hasattr(obj, "cache_clear"):
+                obj.cache_clear()
+
+    clear()
+    yield
+    clear()
+
+
 @pytest.fixture
 def root_url(mock_environ):
-    tc.get_root_url.cache_clear()
     return tc.get_root_url(False)
 
 
@@ -36,41 +79,39 @@ def root_url(mock_environ):
 def proxy_root_url(monkeypatch, mock_environ):
     monkeypatch.setenv("TASK_ID", "123")
     monkeypatch.setenv("TASKCLUSTER_PROXY_URL", "https://taskcluster-proxy.net")
-    tc.get_root_url.cache_clear()
     return tc.get_root_url(True)
 
 
 def test_get_root_url(monkeypatch):
-    tc.get_root_url.cache_clear()
-    assert tc.get_root_url(False) == tc.PRODUCTION_TASKCLUSTER_ROOT_URL
-
     custom_url = "https://taskcluster-root.net"
-    monkeypatch.setenv("TASKCLUSTER_ROOT_URL", custom_url)
-    tc.get_root_url.cache_clear()
-    assert tc.get_root_url(False) == custom_url
-
-    # trailing slash is normalized
-    monkeypatch.setenv("TASKCLUSTER_ROOT_URL", custom_url + "/")
-    tc.get_root_url.cache_clear()
-    assert tc.get_root_url(False) == custom_url
-
-    with pytest.raises(RuntimeError):
-        tc.get_root_url(True)
-
-    task_id = "123"
-    monkeypatch.setenv("TASK_ID", task_id)
-
-    with pytest.raises(RuntimeError):
-        tc.get_root_url(True)
-
     proxy_url = "https://taskcluster-proxy.net"
-    monkeypatch.setenv("TASKCLUSTER_PROXY_URL", proxy_url)
-    assert tc.get_root_url(True) == proxy_url
-    tc.get_root_url.cache_clear()
+
+    # Each step updates the environment cumulatively, then checks the result.
+    steps = (
+        ({}, False, tc.PRODUCTION_TASKCLUSTER_ROOT_URL),
+        ({"TASKCLUSTER_ROOT_URL": custom_url}, False, custom_url),
+        # trailing slash is normalized
+        ({"TASKCLUSTER_ROOT_URL": custom_url + "/"}, False, custom_url),
+        ({}, True, RuntimeError),
+        ({"TASK_ID": "123"}, True, RuntimeError),
+        ({"TASKCLUSTER_PROXY_URL": proxy_url}, True, proxy_url),
+    )
+    # The `mock_environ` fixture replaced `os.environ` with a fresh dict, so
+    # it can be updated directly.
+    for env, use_proxy, expected in steps:
+        os.environ.update(env)
+        tc.get_root_url.cache_clear()
+
+        if expected is RuntimeError:
+            with pytest.raises(RuntimeError):
+                tc.get_root_url(use_proxy)
+        else:
+            assert tc.get_root_url(use_proxy) == expected
 
     # no default set
     monkeypatch.setattr(tc, "PRODUCTION_TASKCLUSTER_ROOT_URL", None)
-    monkeypatch.delenv("TASKCLUSTER_ROOT_URL")
+    del os.environ["TASKCLUSTER_ROOT_URL"]
+    tc.get_root_url.cache_clear()
     with pytest.raises(RuntimeError):
         tc.get_root_url(False)
 
@@ -160,7 +201,7 @@ def test_list_artifact(responses, root_url):
     responses.add(
         responses.GET,
         f"{root_url}/api/queue/v1/task/{tid}/artifacts",
-        json={"artifacts": ["file1.txt", "file2.json"]},
+        json=LIST_ARTIFACTS_REPLY,
     )
     assert tc.list_artifacts(tid) == ["file1.txt", "file2.json"]
 
@@ -234,21 +275,10 @@ def test_get_artifact_from_index(responses, root_url):
 
 def test_list_tasks(responses, root_url):
     index = "foo"
-    responses.add(
-        responses.POST,
-        f"{root_url}/api/index/v1/tasks/{index}",
-        json={
-            "continuationToken": "x",
-            "tasks": [{"taskId": "123", "expires": "2023-02-10T19:07:33.700Z"}],
-        },
-    )
-    responses.add(
-        responses.POST,
-        f"{root_url}/api/index/v1/tasks/{index}",
-        json={
-            "tasks": [{"taskId": "abc", "expires": "2023-02-09T19:07:33.700Z"}],
-        },
-    )
+    for reply in LIST_TASKS_REPLIES:
+        responses.add(
+            responses.POST, f"{root_url}/api/index/v1/tasks/{index}", json=reply
+        )
     assert tc.list_tasks(index) == ["abc", "123"]
 
 
@@ -265,9 +295,9 @@ def test_get_task_url(root_url):
 def test_get_task_definition(responses, root_url):
     tid = "123"
     responses.add(
-        responses.GET, f"{root_url}/api/queue/v1/task/{tid}", json={"payload": "blah"}
+        responses.GET, f"{root_url}/api/queue/v1/task/{tid}", json=TASK_DEFINITION
     )
-    assert tc.get_task_definition(tid) == {"payload": "blah"}
+    assert tc.get_task_definition(tid) == TASK_DEFINITION
 
 
 def test_cancel_task(responses, root_url):
@@ -291,14 +321,12 @@ def test_status_task(responses, root_url):
     assert tc.status_task(tid) == {"state": "running"}
 
 
-def test_state_task(responses, root_url):
-    tid = "123"
-    responses.add(
-        responses.GET,
-        f"{root_url}/api/queue/v1/task/{tid}/status",
-        json={"status": {"state": "running"}},
+def test_state_task(monkeypatch):
+    # The request itself is covered by `test_status_task`.
+    monkeypatch.setattr(
+        tc, "status_task", lambda task_id, use_proxy: {"state": "running"}
     )
-    assert tc.state_task(tid) == "running"
+    assert tc.state_task("123") == "running"
 
 
 def test_rerun_task(responses, proxy_root_url):
@@ -357,94 +385,49 @@ def test_list_task_group_incomplete_tasks(responses, root_url):
     tgid = "123"
 
     url = f"{root_url}/api/queue/v1/task-group/{tgid}/list"
-    responses.add(
-        responses.GET,
-        url,
-        json={
-            "continuationToken": "x",
-            "tasks": [
-                {"status": {"taskId": "1", "state": "pending"}},
-                {"status": {"taskId": "2", "state": "unscheduled"}},
-            ],
-        },
-    )
-    responses.add(
-        responses.GET,
-        url,
-        json={
-            "tasks": [
-                {"status": {"taskId": "3", "state": "running"}},
-                {"status": {"taskId": "4", "state": "completed"}},
-            ],
-        },
-    )
+    for reply in LIST_TASK_GROUP_REPLIES:
+        responses.add(responses.GET, url, json=reply)
     assert list(tc.list_task_group_incomplete_tasks(tgid)) == ["1", "2", "3"]
 
 
-def test_get_ancestors(responses, root_url):
-    tc.get_task_definition.cache_clear()
-    tc._get_deps.cache_clear()
+# Maps task ids to their dependencies. A value of `None` means the task
+# definition returns a 404 (e.g, because the task expired).
+ANCESTOR_DEPENDENCIES = {
+    "fff": ["eee", "ddd"],
+    "eee": [],
+    "ddd": ["ccc"],
+    "ccc": [],
+    "bbb": ["aaa"],
+    "aaa": [],
+}
+
+
+@pytest.fixture
+def register_ancestors(responses, root_url):
     base_url = f"{root_url}/api/queue/v1/task"
-    responses.add(
-        responses.GET,
-        f"{base_url}/fff",
-        json={
-            "dependencies": ["eee", "ddd"],
-            "metadata": {
-                "name": "task-fff",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/eee",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-eee",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/ddd",
-        json={
-            "dependencies": ["ccc"],
-            "metadata": {
-                "name": "task-ddd",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/ccc",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-ccc",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/bbb",
-        json={
-            "dependencies": ["aaa"],
-            "metadata": {
-                "name": "task-bbb",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/aaa",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-aaa",
-            },
-        },
-    )
+
+    def inner(dependencies):
+        for task_id, deps in dependencies.items():
+            if deps is None:
+                responses.add(responses.GET, f"{base_url}/{task_id}", status=404)
+                continue
+
+            responses.add(
+                responses.GET,
+                f"{base_url}/{task_id}",
+                json={
+                    "dependencies": deps,
+                    "metadata": {
+                        "name": f"task-{task_id}",
+                    },
+                },
+            )
+
+    return inner
+
+
+def test_get_ancestors(register_ancestors):
+    register_ancestors(ANCESTOR_DEPENDENCIES)
 
     got = tc.get_ancestors(["bbb", "fff"])
     expected = {
@@ -456,52 +439,13 @@ def test_get_ancestors(responses, root_url):
     assert got == expected, f"got: {got}, expected: {expected}"
 
 
-def test_get_ancestors_404(responses, root_url):
+def test_get_ancestors_404(register_ancestors):
     """Ensures that get_ancestors functions even if some upstream dependencies
     are 404s from expired tasks."""
-    tc.get_task_definition.cache_clear()
-    tc._get_deps.cache_clear()
-    base_url = f"{root_url}/api/queue/v1/task"
-    responses.add(
-        responses.GET,
-        f"{base_url}/fff",
-        json={
-            "dependencies": ["eee", "ddd"],
-            "metadata": {
-                "name": "task-fff",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/eee",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-eee",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/ddd",
-        json={
-            "dependencies": ["ccc"],
-            "metadata": {
-                "name": "task-ddd",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/ccc",
-        status=404,
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/bbb",
-        status=404,
-    )
+    dependencies = {**ANCESTOR_DEPENDENCIES, "ccc": None, "bbb": None}
+    # "aaa" is only reachable through "bbb".
+    del dependencies["aaa"]
+    register_ancestors(dependencies)
 
     got = tc.get_ancestors(["bbb", "fff"])
     expected = {
@@ -511,69 +455,14 @@ def test_get_ancestors_404(responses, root_url):
     assert got == expected, f"got: {got}, expected: {expected}"
 
 
-def test_get_ancestors_string(responses, root_url):
-    tc.get_task_definition.cache_clear()
-    tc._get_deps.cache_clear()
-    base_url = f"{root_url}/api/queue/v1/task"
-    responses.add(
-        responses.GET,
-        f"{base_url}/fff",
-        json={
-            "dependencies": ["eee", "ddd"],
-            "metadata": {
-                "name": "task-fff",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/eee",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-eee",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/ddd",
-        json={
-            "dependencies": ["ccc", "bbb"],
-            "metadata": {
-                "name": "task-ddd",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/ccc",
-        json={
-            "dependencies": ["aaa"],
-            "metadata": {
-                "name": "task-ccc",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/bbb",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-bbb",
-            },
-        },
-    )
-    responses.add(
-        responses.GET,
-        f"{base_url}/aaa",
-        json={
-            "dependencies": [],
-            "metadata": {
-                "name": "task-aaa",
-            },
-        },
+def test_get_ancestors_string(register_ancestors):
+    register_ancestors(
+        {
+            **ANCESTOR_DEPENDENCIES,
+            "ddd": ["ccc", "bbb"],
+            "ccc": ["aaa"],
+            "bbb": [],
+        }
     )
 
     got = tc.get_ancestors("fff")
@@ -3,9 +3,9 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
-import unittest
 from datetime import datetime
-from unittest.mock import patch
+
+import pytest
 
 from taskgraph.util.time import (
     InvalidString,
@@ -15,46 +15,57 @@ from taskgraph.util.time import (
     value_of,
 )
 
+NOW = datetime(2014, 1, 1)
+
+
+@pytest.mark.parametrize(
+    "spec,seconds",
+    (
+        ("1s", 1),
+        ("1 second", 1),
+        ("1min", 60),
+        ("1h", 3600),
+        ("1d", 86400),
+        ("1mo", 2592000),
+        ("1 month", 2592000),
+        ("1y", 31536000),
+    ),
+)
+def test_value_of(spec, seconds):
+    assert value_of(spec).total_seconds() == seconds
+
+
+@pytest.mark.parametrize(
+    "spec,exception",
+    (
+        pytest.param("wtfs", InvalidString, id="invalid str"),
+        pytest.param("1", InvalidString, id="missing unit"),
+        pytest.param("1z", UnknownTimeMeasurement, id="unknown unit"),
+        # ambiguous between minute and month
+        pytest.param("1m", UnknownTimeMeasurement, id="ambiguous unit"),
+    ),
+)
+def test_value_of_invalid(spec, exception):
+    with pytest.raises(exception):
+        value_of(spec)
+
+
+def test_json_from_now_utc_now():
+    now = datetime(2024, 1, 1)
+    assert json_time_from_now("1 years", now) == "2024-12-31T00:00:00.000Z"
+
+
+@pytest.mark.slow
+def test_json_from_now_live():
+    # Just here to ensure we don't raise when reading the wall clock.
+    json_time_from_now("1 years")
+
+
+def test_json_from_now():
+    assert json_time_from_now("1 years", NOW) == "2015-01-01T00:00:00.000Z"
+    assert json_time_from_now("6 days", NOW) == "2014-01-07T00:00:00.000Z"
+
 
-class FromNowTest(unittest.TestCase):
-    def test_invalid_str(self):
-        with self.assertRaises(InvalidString):
-            value_of("wtfs")
-
-    def test_missing_unit(self):
-        with self.assertRaises(InvalidString):
-            value_of("1")
-
-    def test_missing_unknown_unit(self):
-        with self.assertRaises(UnknownTimeMeasurement):
-            value_of("1z")
-
-    def test_value_of(self):
-        self.assertEqual(value_of("1s").total_seconds(), 1)
-        self.assertEqual(value_of("1 second").total_seconds(), 1)
-        self.assertEqual(value_of("1min").total_seconds(), 60)
-        self.assertEqual(value_of("1h").total_seconds(), 3600)
-        self.assertEqual(value_of("1d").total_seconds(), 86400)
-        self.assertEqual(value_of("1mo").total_seconds(), 2592000)
-        self.assertEqual(value_of("1 month").total_seconds(), 2592000)
-        self.assertEqual(value_of("1y").total_seconds(), 31536000)
-
-        with self.assertRaises(UnknownTimeMeasurement):
-            value_of("1m").total_seconds()  # ambiguous between minute and month
-
-    def test_json_from_now_utc_now(self):
-        # Just here to ensure we don't raise.
-        json_time_from_now("1 years")
-
-    def test_json_from_now(self):
-        now = datetime(2014, 1, 1)
-        self.assertEqual(json_time_from_now("1 years", now), "2015-01-01T00:00:00.000Z")
-        self.assertEqual(json_time_from_now("6 days", now), "2014-01-07T00:00:00.000Z")
-
-    def test_current_json_time(self):
-        with patch("taskgraph.util.time.datetime.datetime") as mock_datetime:
-            mock_datetime.utcnow.return_value = datetime(2014, 1, 1)
-            mock_datetime.side_effect = datetime
-
-            assert current_json_time() == "2014-01-01T00:00:00.000Z"
-            assert current_json_time(True) == datetime(2014, 1, 1)
+def test_current_json_time():
+    assert current_json_time(now=NOW) == "2014-01-01T00:00:00.000Z"
+    assert current_json_time(True, now=NOW) == NOW
@@ -4,27 +4,52 @@
 
 import os
 import subprocess
+from pathlib import Path
 from textwrap import dedent
 
 import pytest
 
-from taskgraph.util.vcs import HgRepository, Repository, get_repository
+from taskgraph.util.vcs import GitRepository, HgRepository, Repository, get_repository
+
+
+def _write(repo, name, data):
+    (Path(repo.path) / name).write_text(data)
+
+
+def _remove(repo, name):
+    (Path(repo.path) / name).unlink()
+
+
+def _stage_and_commit(repo, files, message):
+    """Write `files`, a mapping of file names to contents, and commit them.
+
+    Files mapped to `None` are removed instead. Mercurial can add, remove
+    and commit in a single invocation.
+    """
+    for name, data in files.items():
+        if data is None:
+            _remove(repo, name)
+        else:
+            _write(repo, name, data)
+
+    if repo.tool == "hg":
+        repo.run("commit", "--addremove", "-m", message)
+    else:
+        repo.run("add", "--all", *files)
+        repo.run("commit", "-m", message)
 
 
 def test_get_repository(repo):
     r = get_repository(repo.path)
     assert isinstance(r, Repository)
 
-    new_dir = os.path.join(repo.path, "new_dir")
-    oldcwd = os.getcwd()
-    try:
-        os.mkdir(new_dir)
-        os.chdir(new_dir)
-        r = get_repository(new_dir)
-        assert isinstance(r, Repository)
-    finally:
-        os.chdir(oldcwd)
-        os.rmdir(new_dir)
+    # `get_repository` takes the path explicitly, so there's no need to
+    # change the (process wide) working directory.
+    new_dir = Path(repo.path) / "new_dir"
+    new_dir.mkdir()
+    r = get_repository(new_dir)
+    assert isinstance(r, Repository)
+    assert r.path == repo.path
 
 
 def test_get_repository_type(repo):
@@ -34,13 +59,13 @@ def test_get_repository_type(repo):
         assert repo.tool == "git"
 
 
-def test_get_repository_type_failure(tmpdir):
+def test_get_repository_type_failure(tmp_path):
     with pytest.raises(RuntimeError):
-        get_repository(tmpdir.strpath)
+        get_repository(str(tmp_path))
 
 
 def test_hgplain(monkeypatch, hg_repo):
-    repo = get_repository(hg_repo)
+    repo = HgRepository(hg_repo)
 
     def fake_check_output(*args, **kwargs):
         return args, kwargs
@@ -52,6 +77,14 @@ def test_hgplain(monkeypatch, hg_repo):
     assert kwargs["env"]["HGPLAIN"] == "1"
 
 
+def test_run_return_codes(hg_repo):
+    repo = HgRepository(hg_repo)
+    assert repo.run("log", "-r", "unknown", return_codes=(255,)) == ""
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        repo.run("log", "-r", "unknown")
+    assert excinfo.value.returncode == 255
+
+
 @pytest.mark.parametrize(
     "commit_message",
     (
@@ -60,11 +93,9 @@ def test_hgplain(monkeypatch, hg_repo):
     ),
 )
 def test_get_commit_message(repo, commit_message):
-    some_file_path = os.path.join(repo.path, "some_file")
-    with open(some_file_path, "w") as f:
-        f.write("some data")
+    _write(repo, "some_file", "some data")
 
-    repo.run("add", some_file_path)
+    repo.run("add", "some_file")
     if repo.tool == "hg":
         repo.run("commit", "-l-", input=commit_message)
     else:
@@ -83,16 +114,17 @@ def test_calculate_head_rev(repo):
 
 def test_get_repo_path(repo):
     if repo.tool == "hg":
-        with open(os.path.join(repo.path, ".hg/hgrc"), "w") as f:
-            f.write(
-                dedent(
-                    """
+        _write(
+            repo,
+            ".hg/hgrc",
+            dedent(
+                """
                 [paths]
                 default = https://some/repo
                 other = https://some.other/repo
                 """
-                )
-            )
+            ),
+        )
     else:
         repo.run("remote", "add", "origin", "https://some/repo")
         repo.run("remote", "add", "other", "https://some.other/repo")
@@ -102,13 +134,8 @@ def test_get_repo_path(repo):
 
 
 def test_update(repo):
-    bar = os.path.join(repo.path, "bar")
-    with open(bar, "w") as fh:
-        fh.write("bar")
-
     first_rev = repo.head_rev
-    repo.run("add", bar)
-    repo.run("commit", "-m", "Second commit")
+    _stage_and_commit(repo, {"bar": "bar"}, "Second commit")
 
     second_rev = repo.head_rev
     repo.update(first_rev)
@@ -128,12 +155,7 @@ def test_branch(repo):
 
     assert repo.branch == "test"
 
-    bar = os.path.join(repo.path, "bar")
-    with open(bar, "w") as fh:
-        fh.write("bar")
-
-    repo.run("add", bar)
-    repo.run("commit", "-m", "Second commit")
+    _stage_and_commit(repo, {"bar": "bar"}, "Second commit")
     assert repo.branch == "test"
 
     repo.update(repo.head_rev)
@@ -157,16 +179,16 @@ def test_remote_name(repo_with_remote):
         assert repo.remote_name == remote_name
 
 
-def test_all_remote_names(tmpdir, create_remote_repo, repo_with_remote):
+def test_all_remote_names(tmp_path, create_remote_repo, repo_with_remote):
     repo, remote_name = repo_with_remote
     assert repo.all_remote_names == [remote_name]
-    create_remote_repo(tmpdir, repo, "upstream2", "remote_path2")
+    create_remote_repo(tmp_path, repo, "upstream2", "remote_path2")
     assert repo.all_remote_names == [remote_name, "upstream2"]
 
 
-def test_remote_name_many_remotes(tmpdir, create_remote_repo, repo_with_remote):
+def test_remote_name_many_remotes(tmp_path, create_remote_repo, repo_with_remote):
     repo, _ = repo_with_remote
-    create_remote_repo(tmpdir, repo, "upstream2", "remote_path2")
+    create_remote_repo(tmp_path, repo, "upstream2", "remote_path2")
 
     if repo.tool == "git":
         assert repo.remote_name == "upstream2"  # Branch is set to an upstream one
@@ -175,10 +197,10 @@ def test_remote_name_many_remotes(tmpdir, create_remote_repo, repo_with_remote):
     assert repo.remote_name == "upstream"
 
 
-def test_remote_name_default_and_origin(tmpdir, create_remote_repo, repo_with_remote):
+def test_remote_name_default_and_origin(tmp_path, create_remote_repo, repo_with_remote):
     repo, _ = repo_with_remote
     remote_name = "origin" if repo.tool == "git" else "default"
-    create_remote_repo(tmpdir, repo, remote_name, "remote_path2")
+    create_remote_repo(tmp_path, repo, remote_name, "remote_path2")
 
     if repo.tool == "git":
         repo.run("branch", "--unset-upstream")
@@ -201,17 +223,18 @@ def test_default_branch_remote_query(default_git_branch, repo_with_remote):
         assert repo.default_branch == "default"
 
 
-def test_default_branch_cloned_metadata(tmpdir, default_git_branch, repo):
+def test_default_branch_cloned_metadata(tmp_path, default_git_branch, repo):
     if repo.tool == "git":
-        clone_repo_path = tmpdir / "cloned_repo"
+        clone_repo_path = tmp_path / "cloned_repo"
         command = ("git", "clone", repo.path, clone_repo_path)
-        subprocess.check_output(command, cwd=tmpdir)
-        cloned_repo = get_repository(clone_repo_path)
+        subprocess.check_output(command, cwd=tmp_path)
+        cloned_repo = GitRepository(clone_repo_path)
         assert cloned_repo.default_branch == f"origin/{default_git_branch}"
 
 
 def assert_files(actual, expected):
-    assert set(map(os.path.basename, actual)) == set(expected)
+    # Revision ranges list a file once per revision that touches it.
+    assert sorted({os.path.basename(path) for path in actual}) == sorted(expected)
 
 
 def test_get_changed_files_no_changes(repo):
@@ -222,8 +245,7 @@ def test_get_changed_files_no_changes(repo):
 
 
 def test_get_changed_files_one_modified_file(repo):
-    with open(os.path.join(repo.path, "first_file"), "w") as f:
-        f.write("some new data")
+    _write(repo, "first_file", "some new data")
 
     assert_files(repo.get_changed_files("A", "all"), [])
     assert_files(repo.get_changed_files("M", "all"), ["first_file"])
@@ -244,7 +266,7 @@ def test_get_changed_files_one_modified_file(repo):
 
 
 def test_get_changed_files_one_deleted_file(repo):
-    os.remove(os.path.join(repo.path, "first_file"))
+    _remove(repo, "first_file")
 
     assert_files(repo.get_changed_files("A", "all"), [])
     assert_files(repo.get_changed_files("M", "all"), [])
@@ -258,8 +280,7 @@ def test_get_changed_files_one_deleted_file(repo):
 
 
 def test_get_changed_files_one_added_file(repo):
-    with open(os.path.join(repo.path, "second_file"), "w") as f:
-        f.write("some data for the second file")
+    _write(repo, "second_file", "some data for the second file")
 
     assert_files(repo.get_changed_files("A", "all"), [])  # File is still untracked
     assert_files(repo.get_changed_files("M", "all"), [])
@@ -275,28 +296,25 @@ def test_get_changed_files_one_added_file(repo):
 
 
 def test_get_changed_files_two_revisions(repo):
-    with open(os.path.join(repo.path, "second_file"), "w") as f:
-        f.write("some data for the second file")
-    with open(os.path.join(repo.path, "fourth_file"), "w") as f:
-        f.write("some data for the fourth file")
-    repo.run("add", "second_file", "fourth_file")
-    repo.run("commit", "-m", "Add second_file and fourth_file")
-
-    os.remove(os.path.join(repo.path, "first_file"))
-    with open(os.path.join(repo.path, "second_file"), "w") as f:
-        f.write("new data for second file")
-    with open(os.path.join(repo.path, "third_file"), "w") as f:
-        f.write("third type of data")
-    os.rename(
-        os.path.join(repo.path, "fourth_file"),
-        os.path.join(repo.path, "fourth_file_new"),
+    _stage_and_commit(
+        repo,
+        {
+            "second_file": "some data for the second file",
+            "fourth_file": "some data for the fourth file",
+        },
+        "Add second_file and fourth_file",
     )
 
-    repo.run("rm", "first_file", "fourth_file")
-    repo.run("add", ".")
-    repo.run(
-        "commit",
-        "-m",
+    _stage_and_commit(
+        repo,
+        {
+            "first_file": None,
+            "second_file": "new data for second file",
+            "third_file": "third type of data",
+            # Renames are reported as a deletion and an addition.
+            "fourth_file": None,
+            "fourth_file_new": "some data for the fourth file",
+        },
         "Remove first_file; modify second_file; add third_file, rename fourth_file",
     )
 
@@ -348,11 +366,9 @@ def test_get_changed_files_two_revisions(repo):
 def test_workdir_outgoing(repo_with_upstream):
     repo, upstream_location = repo_with_upstream
 
-    os.remove(os.path.join(repo.path, "first_file"))
-    with open(os.path.join(repo.path, "second_file"), "w") as f:
-        f.write("new data for second file")
-    with open(os.path.join(repo.path, "third_file"), "w") as f:
-        f.write("third type of data")
+    _remove(repo, "first_file")
+    _write(repo, "second_file", "new data for second file")
+    _write(repo, "third_file", "third type of data")
 
     assert_files(repo.get_outgoing_files("AMD"), [])
     assert_files(repo.get_outgoing_files("AMD", upstream_location), [])
@@ -370,10 +386,9 @@ def test_workdir_outgoing(repo_with_upstream):
     assert_files(repo.get_outgoing_files("M", upstream_location), ["second_file"])
     assert_files(repo.get_outgoing_files("D", upstream_location), ["first_file"])
 
-    with open(os.path.join(repo.path, "fourth_file"), "w") as f:
-        f.write("breaking the fourth wall")
-    repo.run("add", ".")
-    repo.run("commit", "-m", "Add fourth file")
+    _stage_and_commit(
+        repo, {"fourth_file": "breaking the fourth wall"}, "Add fourth file"
+    )
 
     assert_files(repo.get_outgoing_files("A"), ["fourth_file", "third_file"])
     assert_files(repo.get_outgoing_files("M"), ["second_file"])
@@ -389,9 +404,7 @@ def test_working_directory_clean(repo):
     assert repo.working_directory_clean()
 
     # untracked file
-    bar = os.path.join(repo.path, "bar")
-    with open(bar, "w") as fh:
-        fh.write("bar")
+    _write(repo, "bar", "bar")
 
     assert repo.working_directory_clean()
     assert not repo.working_directory_clean(untracked=True)
@@ -402,8 +415,7 @@ def test_working_directory_clean(repo):
     assert repo.working_directory_clean()
 
     # modified file
-    with open(bar, "a") as fh:
-        fh.write("bar2")
+    _write(repo, "bar", "barbar2")
     assert not repo.working_directory_clean()
 
     if repo.tool == "git":
@@ -413,7 +425,7 @@ def test_working_directory_clean(repo):
     assert repo.working_directory_clean()
 
     # removed file
-    repo.run("rm", bar)
+    repo.run("rm", "bar")
     assert not repo.working_directory_clean()
 
 
@@ -422,11 +434,7 @@ def test_find_latest_common_revision(repo_with_remote):
 
     expected_latest_common_revision = repo.head_rev
 
-    with open(os.path.join(repo.path, "some_file"), "w") as f:
-        f.write("some content")
-
-    repo.run("add", ".")
-    repo.run("commit", "-m", "Add new revision")
+    _stage_and_commit(repo, {"some_file": "some content"}, "Add new revision")
 
     assert repo.head_rev != expected_latest_common_revision
 
@@ -457,11 +465,9 @@ def test_find_latest_common_revision(repo_with_remote):
 
         # Test no common ancestors
         repo.run("update", Repository.NULL_REVISION)
-        with open(os.path.join(repo.path, "some_file"), "w") as f:
-            f.write("some content")
-
-        repo.run("add", ".")
-        repo.run("commit", "-m", "Add another new revision")
+        _stage_and_commit(
+            repo, {"some_file": "some content"}, "Add another new revision"
+        )
         assert (
             repo.find_latest_common_revision(
                 repo.head_rev, expected_latest_common_revision
@@ -473,13 +479,165 @@ def test_find_latest_common_revision(repo_with_remote):
 def test_does_revision_exist_locally(repo):
     first_revision = repo.head_rev
 
-    with open(os.path.join(repo.path, "some_file"), "w") as f:
-        f.write("some content")
-
-    repo.run("add", ".")
-    repo.run("commit", "-m", "Add new revision")
+    _stage_and_commit(repo, {"some_file": "some content"}, "Add new revision")
 
     last_revision = repo.head_rev
     assert repo.does_revision_exist_locally(first_revision)
     assert repo.does_revision_exist_locally(last_revision)
     assert not repo.does_revision_exist_locally("deadbeef")
+
+
+@pytest.mark.parametrize("revision", ("", " "))
+def test_does_revision_exist_locally_blank(mocker, repo, revision):
+    run = mocker.spy(repo, "run")
+    assert not repo.does_revision_exist_locally(revision)
+    assert run.call_count == 0
+
+
+def test_head_rev_memoized(repo, mocker):
+    first_rev = repo.head_rev
+    run = mocker.spy(repo, "run")
+    assert repo.head_rev == first_rev
+    assert run.call_count == 0
+
+    # Mutating commands invalidate the memoized value.
+    _stage_and_commit(repo, {"some_file": "some content"}, "Add new revision")
+    assert repo.head_rev != first_rev
+
+
+def test_head_rev_invalidated_by_unlisted_commands(repo):
+    first_rev = repo.head_rev
+    _stage_and_commit(repo, {"some_file": "some content"}, "Add new revision")
+    assert repo.head_rev != first_rev
+
+    # Aliases and plumbing commands aren't known to be read-only either.
+    if repo.tool == "hg":
+        repo.run("up", "-r", first_rev)
+    else:
+        repo.run("update-ref", "HEAD", first_rev)
+    assert repo.head_rev == first_rev
+
+
+def test_invalidate_caches(repo):
+    head_rev = repo.head_rev
+    repo.branch
+
+    # Changes made without going through `repo.run` aren't seen until the
+    # caches are invalidated.
+    _write(repo, "some_file", "some content")
+    if repo.tool == "hg":
+        cmds = [["hg", "commit", "--addremove", "-m", "Add some_file"]]
+    else:
+        cmds = [
+            ["git", "add", "some_file"],
+            ["git", "commit", "-m", "Add some_file"],
+            ["git", "checkout", "-b", "other"],
+        ]
+    for cmd in cmds:
+        subprocess.check_output(cmd, cwd=repo.path)
+    assert repo.head_rev == head_rev
+
+    repo.invalidate_caches()
+    assert repo.head_rev != head_rev
+    if repo.tool == "git":
+        assert repo.branch == "other"
+
+
+def test_remote_name_memoized(repo_with_remote, mocker):
+    repo, remote_name = repo_with_remote
+    assert repo.remote_name == remote_name
+    assert repo.all_remote_names == [remote_name]
+    run = mocker.spy(repo, "run")
+    assert repo.remote_name == remote_name
+    assert repo.all_remote_names == [remote_name]
+    assert run.call_count == 0
+
+    # Read-only queries don't invalidate memoized values.
+    if repo.tool == "git":
+        repo.run("remote")
+        repo.run("branch", "--show-current")
+        run.reset_mock()
+        assert repo.remote_name == remote_name
+        assert run.call_count == 0
+
+    # Changes made to the config without going through `repo.run` are seen.
+    if repo.tool == "hg":
+        with open(os.path.join(repo.path, ".hg", "hgrc"), "a") as f:
+            f.write("other = https://some.other/repo\n")
+    else:
+        subprocess.check_output(
+            ["git", "remote", "add", "other", "https://some.other/repo"],
+            cwd=repo.path,
+        )
+    assert set(repo.all_remote_names) == {remote_name, "other"}
+
+
+def test_default_branch_guess_keeps_memoized_values(repo):
+    repo.head_rev
+    repo.default_branch
+    assert "head_rev" in vars(repo)
+
+
+def test_default_branch_remote_query_memoized(
+    default_git_branch, repo_with_remote, mocker
+):
+    repo, remote_name = repo_with_remote
+    if repo.tool == "git":
+        assert repo.default_branch == f"{remote_name}/{default_git_branch}"
+        run = mocker.spy(repo, "run")
+        assert repo.default_branch == f"{remote_name}/{default_git_branch}"
+        assert "ls-remote" not in [call.args[0] for call in run.call_args_list]
+
+
+def test_default_branch_cloned_metadata_changed(tmp_path, default_git_branch, repo):
+    if repo.tool == "git":
+        clone_repo_path = tmp_path / "cloned_repo"
+        command = ("git", "clone", repo.path, clone_repo_path)
+        subprocess.check_output(command, cwd=tmp_path)
+        cloned_repo = GitRepository(clone_repo_path)
+        assert cloned_repo.default_branch == f"origin/{default_git_branch}"
+
+        # Remote refs may change without going through `cloned_repo.run`.
+        for cmd in (
+            ("update-ref", "refs/remotes/origin/other", "HEAD"),
+            ("remote", "set-head", "origin", "other"),
+        ):
+            subprocess.check_output(("git",) + cmd, cwd=clone_repo_path)
+        assert cloned_repo.default_branch == "origin/other"
+
+
+def test_get_changed_files_memoized(repo, mocker):
+    _stage_and_commit(repo, {"some_file": "some content"}, "Add some_file")
+    rev = repo.head_rev
+    run = mocker.spy(repo, "_run_bytes")
+    assert repo.get_changed_files("A", rev=rev) == ["some_file"]
+    assert repo.get_changed_files("DM", rev=rev) == []
+    assert repo.get_changed_files("AMD", rev=rev) == ["some_file"]
+    assert run.call_count == 1
+
+    # Symbolic revisions may move, so they aren't memoized.
+    symbolic_rev = "." if repo.tool == "hg" else "HEAD"
+    assert repo.get_changed_files("A", rev=symbolic_rev) == ["some_file"]
+    _stage_and_commit(repo, {"other_file": "some content"}, "Add other_file")
+    assert repo.get_changed_files("A", rev=symbolic_rev) == ["other_file"]
+
+
+def test_get_changed_files_memoized_bounded(repo, monkeypatch):
+    monkeypatch.setattr(repo, "_CHANGED_FILES_CACHE_SIZE", 1)
+    _stage_and_commit(repo, {"some_file": "some content"}, "Add some_file")
+    first_rev = repo.head_rev
+    _stage_and_commit(repo, {"other_file": "some content"}, "Add other_file")
+    second_rev = repo.head_rev
+    assert repo.get_changed_files("A", rev=first_rev) == ["some_file"]
+    assert repo.get_changed_files("A", rev=second_rev) == ["other_file"]
+    assert list(repo._changed_files) == [(second_rev, None)]
+
+
+def test_get_changed_files_special_characters(repo):
+    # Paths are listed NUL separated, so they are never quoted or escaped.
+    name = "some file\twith ünicode"
+    _stage_and_commit(repo, {name: "some content"}, "Add file")
+    assert repo.get_changed_files("A", rev=repo.head_rev) == [name]
+
+    _write(repo, name, "new content")
+    assert repo.get_changed_files("M") == [name]
@@ -3,7 +3,6 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from functools import partial
-from itertools import chain
 
 import pytest
 from pytest_taskgraph import make_graph, make_task
@@ -12,36 +11,54 @@ from taskgraph.task import Task
 from taskgraph.util.treeherder import split_symbol
 from taskgraph.util.verify import (
     GraphVerification,
+    InitialVerification,
+    KindsVerification,
     ParametersVerification,
     VerificationSequence,
     verifications,
 )
 
+# Verifications only read the graph, so a single instance is shared by all tests.
+_BASE_GRAPH = make_graph(
+    make_task("a"),
+    make_task("b", attributes={"at-at": "yep"}),
+    make_task("c", attributes={"run_on_projects": ["try"]}),
+)
+
+
+def _set_graph_kwargs(kwargs, parameters, graph_config):
+    assert "graph" in kwargs
+    kwargs.setdefault("graph_config", graph_config)
+    kwargs.setdefault("parameters", parameters)
+
 
-def get_graph():
-    tasks = [
-        make_task("a"),
-        make_task("b", attributes={"at-at": "yep"}),
-        make_task("c", attributes={"run_on_projects": ["try"]}),
-    ]
-    return make_graph(*tasks)
+def _set_parameters_kwargs(kwargs, parameters, graph_config):
+    kwargs.setdefault("parameters", parameters)
+
+
+# Fills in the arguments each type of verification expects. Other
+# verification types don't take any defaults.
+_KWARG_SETTERS = {
+    GraphVerification: _set_graph_kwargs,
+    ParametersVerification: _set_parameters_kwargs,
+}
 
 
 @pytest.fixture
 def run_verification(parameters, graph_config):
     def inner(name, **kwargs):
-        for v in chain(*verifications._verifications.values()):
-            if v.func.__name__ == name:
-                break
-        else:
+        v = verifications.get(name)
+        if v is None:
             raise Exception(f"verification '{name}' not found!")
 
-        if isinstance(v, GraphVerification):
-            assert "graph" in kwargs
-            kwargs.setdefault("graph_config", graph_config)
-
-        if isinstance(v, (GraphVerification, ParametersVerification)):
-            kwargs.setdefault("parameters", parameters)
+        setter = _KWARG_SETTERS.get(type(v))
+        if setter is None:
+            # Subclasses take the same arguments as the type they extend.
+            setter = next(
+                (s for cls, s in _KWARG_SETTERS.items() if isinstance(v, cls)), None
+            )
+        if setter:
+            setter(kwargs, parameters, graph_config)
 
         return v.verify(**kwargs)
 
@@ -53,7 +70,7 @@ def assert_graph_verification(task, tg, scratch_pad, graph_config, parameters):
         assert isinstance(task, Task)
     else:
         assert task is None
-    assert tg == get_graph()
+    assert tg is _BASE_GRAPH
     assert scratch_pad == {}
     assert graph_config == "graph_config"
     assert parameters == "parameters"
@@ -63,12 +80,21 @@ def assert_simple_verification(arg):
     assert arg == "passed-thru"
 
 
+# The verification class each sequence name is expected to register.
+_EXPECTED_TYPE = {
+    "full_task_graph": GraphVerification,
+    "initial": InitialVerification,
+    "kinds": KindsVerification,
+    "parameters": ParametersVerification,
+}
+
+
 @pytest.mark.parametrize(
     "name,input,run_assertions,expected_called",
     (
         pytest.param(
             "full_task_graph",
-            (get_graph(), "graph_config", "parameters"),
+            (_BASE_GRAPH, "graph_config", "parameters"),
             assert_graph_verification,
             4,
             id="GraphVerification",
@@ -107,14 +133,25 @@ def test_verification_types(name, input, run_assertions, expected_called):
         run_assertions(*args, **kwargs)
 
     assert len(v._verifications[name]) == 1
-    assert isinstance(
-        v._verifications[name][0], v._verification_types.get(name, GraphVerification)
-    )
+    assert isinstance(v._verifications[name][0], _EXPECTED_TYPE[name])
     assert called == 0
     v(name, *input)
     assert called == expected_called
 
 
+def test_verification_sequence_get():
+    v = VerificationSequence()
+
+    @v.add("parameters")
+    def verify_something(parameters):
+        pass
+
+    verification = v.get("verify_something")
+    assert isinstance(verification, ParametersVerification)
+    assert verification.func is verify_something
+    assert v.get("verify_nothing") is None
+
+
 def make_task_treeherder(label, symbol, platform="linux/opt"):
     config = {"machine": {}}
     config["groupSymbol"], config["symbol"] = split_symbol(symbol)
@@ -123,83 +160,94 @@ def make_task_treeherder(label, symbol, platform="linux/opt"):
     return make_task(label, task_def={"extra": {"treeherder": config}})
 
 
+# Graphs for `test_verification`, built once and looked up by key.
+_GRAPHS = {
+    "symbol-valid": make_graph(
+        make_task_treeherder("a", "M(1)", "linux/opt"),
+        make_task_treeherder("b", "M(1)", "windows/opt"),
+        make_task_treeherder("c", "M(1)", "linux/debug"),
+        make_task_treeherder("d", "M(2)", "linux/opt"),
+        make_task_treeherder("e", "1", "linux/opt"),
+    ),
+    "symbol-conflict": make_graph(
+        make_task_treeherder("a", "M(1)"),
+        make_task_treeherder("b", "M(1)"),
+    ),
+    "symbol-collections": make_graph(
+        make_task(
+            "a",
+            task_def={
+                "extra": {"treeherder": {"collection": {"foo": True, "bar": True}}}
+            },
+        ),
+    ),
+    "routes-valid": make_graph(
+        make_task(
+            "good1",
+            task_def={"routes": ["notify.email.default@email.address.on-completed"]},
+        ),
+    ),
+    "routes-invalid": make_graph(
+        make_task(
+            "bad1",
+            task_def={"routes": ["notify.email.default@email.address.on-bogus"]},
+        ),
+    ),
+    "routes-deprecated": make_graph(
+        make_task(
+            "deprecated",
+            task_def={"routes": ["notify.email.default@email.address.on-any"]},
+        ),
+    ),
+}
+
+
+@pytest.fixture
+def graph(request):
+    return _GRAPHS[request.param]
+
+
 @pytest.mark.parametrize(
     "name,graph,exception",
     (
         pytest.param(
             "verify_task_graph_symbol",
-            make_graph(
-                make_task_treeherder("a", "M(1)", "linux/opt"),
-                make_task_treeherder("b", "M(1)", "windows/opt"),
-                make_task_treeherder("c", "M(1)", "linux/debug"),
-                make_task_treeherder("d", "M(2)", "linux/opt"),
-                make_task_treeherder("e", "1", "linux/opt"),
-            ),
+            "symbol-valid",
             None,
             id="task_graph_symbol: valid",
         ),
         pytest.param(
             "verify_task_graph_symbol",
-            make_graph(
-                make_task_treeherder("a", "M(1)"),
-                make_task_treeherder("b", "M(1)"),
-            ),
+            "symbol-conflict",
             Exception,
             id="task_graph_symbol: conflicting symbol",
         ),
         pytest.param(
             "verify_task_graph_symbol",
-            make_graph(
-                make_task(
-                    "a",
-                    task_def={
-                        "extra": {
-                            "treeherder": {"collection": {"foo": True, "bar": True}}
-                        }
-                    },
-                ),
-            ),
+            "symbol-collections",
             Exception,
             id="task_graph_symbol: too many collections",
         ),
         pytest.param(
             "verify_routes_notification_filters",
-            make_graph(
-                make_task(
-                    "good1",
-                    task_def={
-                        "routes": ["notify.email.default@email.address.on-completed"]
-                    },
-                ),
-            ),
+            "routes-valid",
             None,
             id="routes_notfication_filter: valid",
         ),
         pytest.param(
             "verify_routes_notification_filters",
-            make_graph(
-                make_task(
-                    "bad1",
-                    task_def={
-                        "routes": ["notify.email.default@email.address.on-bogus"]
-                    },
-                ),
-            ),
+            "routes-invalid",
             Exception,
             id="routes_notfication_filter: invalid",
         ),
         pytest.param(
             "verify_routes_notification_filters",
-            make_graph(
-                make_task(
-                    "deprecated",
-                    task_def={"routes": ["notify.email.default@email.address.on-any"]},
-                ),
-            ),
+            "routes-deprecated",
             DeprecationWarning,
             id="routes_notfication_filter: deprecated",
         ),
     ),
+    indirect=["graph"],
 )
 @pytest.mark.filterwarnings("error")
 def test_verification(run_verification, name, graph, exception):
@@ -14,6 +14,12 @@ ALIASES = {
 }
 
 
+@pytest.fixture
+def graph_config(graph_config):
+    graph_config["workers"]["aliases"] = ALIASES
+    return graph_config
+
+
 @pytest.mark.parametrize(
     "alias,level,expected",
     (
@@ -23,8 +29,6 @@ ALIASES = {
     ),
 )
 def test_get_worker_type(graph_config, alias, level, expected):
-    graph_config["workers"]["aliases"] = ALIASES
-
     if inspect.isclass(expected) and issubclass(expected, BaseException):
         with pytest.raises(expected):
             get_worker_type(graph_config, alias, level)
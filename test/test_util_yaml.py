@@ -2,42 +2,25 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from textwrap import dedent
+import pytest
 
 from taskgraph.util import yaml
 
-from .mockedopen import MockedOpen
-
-
-def test_load():
-    with MockedOpen(
-        {
-            "/dir1/dir2/foo.yml": dedent(
-                """\
-                prop:
-                    - val1
-                """
-            )
-        }
-    ):
-        assert yaml.load_yaml("/dir1/dir2", "foo.yml") == {"prop": ["val1"]}
-
-
-def test_key_order():
-    with MockedOpen(
-        {
-            "/dir1/dir2/foo.yml": dedent(
-                """\
-                job:
-                    foo: 1
-                    bar: 2
-                    xyz: 3
-                """
-            )
-        }
-    ):
-        assert list(yaml.load_yaml("/dir1/dir2", "foo.yml")["job"].keys()) == [
-            "foo",
-            "bar",
-            "xyz",
-        ]
+
+@pytest.fixture
+def yaml_dir(tmp_path):
+    (tmp_path / "foo.yml").write_text("prop:\n    - val1\n")
+    (tmp_path / "job.yml").write_text("job:\n    foo: 1\n    bar: 2\n    xyz: 3\n")
+    return tmp_path
+
+
+def test_load(yaml_dir):
+    assert yaml.load_yaml(str(yaml_dir), "foo.yml") == {"prop": ["val1"]}
+
+
+def test_key_order(yaml_dir):
+    assert list(yaml.load_yaml(str(yaml_dir), "job.yml")["job"].keys()) == [
+        "foo",
+        "bar",
+        "xyz",
+    ]